@@ -1,13 +1,17 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Response
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, Response
+from fastapi.responses import StreamingResponse, FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo import ASCENDING, DESCENDING
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import List, Optional, NamedTuple
 import uuid
 from datetime import datetime, timezone
 import qrcode
@@ -15,34 +19,34 @@ from qrcode.image.styledpil import StyledPilImage
 from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
 import io
 import base64
-from PIL import Image
+from PIL import Image, ImageColor, UnidentifiedImageError
+import numpy as np
 import shortuuid
 import string
 import secrets
 import re
 import httpx
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, Counter, deque
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+import time
+import threading
+import hashlib
+import json
+import zipfile
+import csv
+import socket
+import shutil
+import tempfile
+import argparse
+import sys
+from datetime import timedelta
 
 ROOT_DIR = Path(__file__).parent
 
-# is.gd API helper
-async def shorten_with_isgd(url: str) -> dict:
-    """Shorten URL using is.gd API"""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://is.gd/create.php",
-                params={"format": "json", "url": url},
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if "shorturl" in data:
-                    return {"success": True, "short_url": data["shorturl"]}
-                else:
-                    return {"success": False, "error": data.get("errormessage", "Unknown error")}
-            return {"success": False, "error": f"HTTP {response.status_code}"}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
@@ -56,6 +60,527 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# ============== WORKER POOLS ==============
+
+# forkserver avoids forking the event loop and the Mongo client's threads
+WORKER_START_METHOD = os.environ.get('WORKER_START_METHOD', 'forkserver')
+
+class WorkerPoolBusy(Exception):
+    """Raised when a worker pool already has too many callers waiting"""
+
+class CPUWorkerPool:
+    """Runs CPU-bound callables off the event loop.
+
+    Work is submitted to a process pool (or a thread pool when processes are
+    unavailable or ``kind="thread"``). At most ``queue_size`` jobs are handed
+    to the executor at once; further callers wait for a slot, and once
+    ``max_waiting`` callers are waiting new ones get ``WorkerPoolBusy``.
+    ``timeout`` bounds the execution of a single job, not its time in line.
+    ``on_done`` is called exactly once: when the job really finishes, or
+    straight away if it never got submitted.
+    """
+
+    def __init__(self, name: str, kind: str = "process", workers: Optional[int] = None,
+                 queue_size: Optional[int] = None, max_waiting: int = 1000, timeout: float = 30.0):
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue_size = max(1, queue_size or self.workers * 2)
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._executor = None
+        self._slots = asyncio.Semaphore(self.queue_size)
+        self._waiting = 0
+
+    def _get_executor(self):
+        if self._executor is None and self.kind == "process":
+            try:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+                )
+            except (OSError, ValueError, NotImplementedError) as e:
+                logging.getLogger(__name__).warning(
+                    "%s pool: process pool unavailable (%s), falling back to threads", self.name, e
+                )
+                self.kind = "thread"
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._executor
+
+    async def run(self, fn, *args, on_done=None):
+        try:
+            if self._waiting >= self.max_waiting:
+                raise WorkerPoolBusy(f"{self.name} pool is busy, try again later")
+            self._waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._waiting -= 1
+
+            loop = asyncio.get_running_loop()
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except Exception:
+                self._slots.release()
+                raise
+        except BaseException:
+            if on_done is not None:
+                on_done()
+            raise
+
+        # The slot is held until the job really finishes, even if we stop
+        # waiting for it, so a timed-out job still counts against the queue.
+        def release_slot(_):
+            try:
+                loop.call_soon_threadsafe(self._slots.release)
+                if on_done is not None:
+                    loop.call_soon_threadsafe(on_done)
+            except RuntimeError:
+                pass
+
+        future.add_done_callback(release_slot)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool next time
+            self._executor = None
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+qr_render_pool = CPUWorkerPool(
+    "qr-render",
+    kind=os.environ.get('QR_RENDER_EXECUTOR', 'process'),
+    workers=int(os.environ.get('QR_RENDER_WORKERS', '0')) or None,
+    queue_size=int(os.environ.get('QR_RENDER_QUEUE_SIZE', '0')) or None,
+    max_waiting=int(os.environ.get('QR_RENDER_MAX_WAITING', '1000')),
+    timeout=float(os.environ.get('QR_RENDER_TIMEOUT', '30')),
+)
+
+image_pool = CPUWorkerPool(
+    "image-convert",
+    kind=os.environ.get('IMAGE_EXECUTOR', 'process'),
+    workers=int(os.environ.get('IMAGE_WORKERS', '0')) or None,
+    queue_size=int(os.environ.get('IMAGE_QUEUE_SIZE', '0')) or None,
+    max_waiting=int(os.environ.get('IMAGE_MAX_WAITING', '200')),
+    timeout=float(os.environ.get('IMAGE_TIMEOUT', '60')),
+)
+
+# ============== CACHES ==============
+
+class LRUCache:
+    """In-process LRU cache with an optional per-entry TTL and hit/miss counters.
+
+    Bounded by entry count and, when ``max_bytes`` is set, by the total
+    ``sizeof(value)`` of the stored values. Not thread-safe; it is only used
+    from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None, sizeof=len):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value, nbytes)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        nbytes = self.sizeof(value) if self.max_bytes is not None else 0
+        self.pop(key)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (expires_at, value, nbytes)
+        self.size_bytes += nbytes
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self.size_bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_bytes) = self._data.popitem(last=False)
+            self.size_bytes -= evicted_bytes
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        self.size_bytes -= entry[2]
+        return entry[1]
+
+    def clear(self):
+        self._data.clear()
+        self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class DiskCache:
+    """Size-bounded, content-addressed file cache with LRU eviction.
+
+    Each entry is one file named after its hex key, sharded into
+    subdirectories by the first two characters. The LRU order is rebuilt from
+    file mtimes on startup and ``get`` bumps the mtime, so recency survives
+    restarts. Methods do blocking file IO; call them via ``asyncio.to_thread``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ""):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> nbytes, least recently used first
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.glob(f"??/*{suffix}"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.name[:len(path.name) - len(suffix)], stat.st_size))
+        for _, key, nbytes in sorted(entries):
+            self._index[key] = nbytes
+            self.size_bytes += nbytes
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                nbytes = self._index.pop(key, None)
+                if nbytes is not None:
+                    self.size_bytes -= nbytes
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            self.hits += 1
+        return data
+
+    def set(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write to a temp file and rename so readers never see partial files
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        evicted = []
+        with self._lock:
+            self.size_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self.size_bytes += len(data)
+            while self.size_bytes > self.max_bytes and len(self._index) > 1:
+                old_key, nbytes = self._index.popitem(last=False)
+                self.size_bytes -= nbytes
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                self._path(old_key).unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class TieredCache:
+    """Memory LRU in front of an optional ``DiskCache``.
+
+    ``get_or_create`` also coalesces concurrent misses: callers asking for a
+    key that is already being produced await the same task instead of
+    producing it again.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def get_or_create(self, key: str, factory) -> bytes:
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._load(key, factory))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one cancelled caller doesn't cancel the others
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, factory) -> bytes:
+        if self.disk is not None:
+            data = await asyncio.to_thread(self.disk.get, key)
+            if data is not None:
+                self.memory.set(key, data)
+                return data
+        data = await factory()
+        self.memory.set(key, data)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, data)
+            except OSError as e:
+                logging.getLogger(__name__).warning("Disk cache write failed: %s", e)
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "coalesced": self.coalesced,
+        }
+
+def cache_key(*parts) -> str:
+    """Stable content hash of JSON-serialisable parts, used as a cache key"""
+    return hashlib.sha256(json.dumps(parts, separators=(",", ":")).encode()).hexdigest()
+
+# ============== STREAMING ==============
+
+# How many items a streaming endpoint keeps in flight at once
+STREAM_WINDOW = int(os.environ.get('STREAM_WINDOW', '32'))
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable buffer that zipfile writes into"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+class ZipStream:
+    """Builds a ZIP archive incrementally for streaming responses.
+
+    ``add`` and ``close`` return the archive bytes produced by that call, so
+    only the current entry is ever held in memory. Because the sink is not
+    seekable, zipfile writes data descriptors after each entry instead of
+    patching local headers.
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_STORED):
+        self._sink = _ZipSink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=compression)
+
+    def add(self, name: str, data: bytes, compress_type: Optional[int] = None) -> bytes:
+        self._zip.writestr(name, data, compress_type=compress_type)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+async def as_completed_bounded(aws, limit: int = STREAM_WINDOW):
+    """Yield results of awaitables in completion order, at most ``limit`` at a time.
+
+    ``aws`` is consumed lazily, so a generator of coroutines is only
+    materialised as slots free up.
+    """
+    pending = set()
+    try:
+        for aw in aws:
+            pending.add(asyncio.ensure_future(aw))
+            if len(pending) >= limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # Client went away or the consumer stopped early
+        for task in pending:
+            task.cancel()
+
+# ============== IS.GD CLIENT ==============
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    are refused for ``reset_timeout`` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            return True
+        # Open, or half-open with the trial call still in flight
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self._failures = 0
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+class IsgdClient:
+    """Shared is.gd client.
+
+    Keeps one pooled ``httpx.AsyncClient`` alive for the whole process, caps
+    the number of concurrent requests, caches long URL -> short URL, and trips
+    a circuit breaker when is.gd is failing or slow so callers fall back to
+    local shortlinks immediately instead of waiting for timeouts.
+    """
+
+    API_URL = "https://is.gd/create.php"
+
+    def __init__(self, timeout: float = 10.0, concurrency: int = 8, max_connections: int = 20,
+                 cache_size: int = 10000, cache_ttl: float = 86400.0, slow_call_threshold: float = 3.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.slow_call_threshold = slow_call_threshold
+        self.cache = LRUCache(max_entries=cache_size, ttl=cache_ttl)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._client
+
+    async def shorten(self, url: str) -> dict:
+        """Shorten URL using is.gd API"""
+        short_url = self.cache.get(url)
+        if short_url is not None:
+            return {"success": True, "short_url": short_url}
+
+        async with self._semaphore:
+            # Checked after queueing so waiters notice a breaker that tripped meanwhile
+            if not self.breaker.allow():
+                return {"success": False, "error": "is.gd temporarily unavailable"}
+            started = time.monotonic()
+            try:
+                response = await self._get_client().get(
+                    self.API_URL, params={"format": "json", "url": url}
+                )
+                data = response.json() if response.status_code == 200 else {}
+            except Exception as e:
+                self.breaker.record_failure()
+                return {"success": False, "error": str(e) or type(e).__name__}
+
+        if response.status_code != 200:
+            self.breaker.record_failure()
+            return {"success": False, "error": f"HTTP {response.status_code}"}
+        # errorcode 1/2 mean is.gd rejected this URL; 3 (rate limit) and 4 (outage) are service failures
+        if data.get("errorcode") in (3, 4) or time.monotonic() - started > self.slow_call_threshold:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if "shorturl" not in data:
+            return {"success": False, "error": data.get("errormessage", "Unknown error")}
+        self.cache.set(url, data["shorturl"])
+        return {"success": True, "short_url": data["shorturl"]}
+
+    async def shorten_many(self, urls: List[str]) -> List[dict]:
+        """Shorten a batch concurrently (bounded by the client's concurrency limit)"""
+        return list(await asyncio.gather(*(self.shorten(url) for url in urls)))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+isgd_client = IsgdClient(
+    timeout=float(os.environ.get('ISGD_TIMEOUT', '10')),
+    concurrency=int(os.environ.get('ISGD_CONCURRENCY', '8')),
+    max_connections=int(os.environ.get('ISGD_MAX_CONNECTIONS', '20')),
+    cache_size=int(os.environ.get('ISGD_CACHE_SIZE', '10000')),
+    cache_ttl=float(os.environ.get('ISGD_CACHE_TTL', '86400')),
+    slow_call_threshold=float(os.environ.get('ISGD_SLOW_CALL_THRESHOLD', '3')),
+    failure_threshold=int(os.environ.get('ISGD_FAILURE_THRESHOLD', '5')),
+    reset_timeout=float(os.environ.get('ISGD_RESET_TIMEOUT', '30')),
+)
+
+async def shorten_with_isgd(url: str) -> dict:
+    """Shorten URL using is.gd API"""
+    return await isgd_client.shorten(url)
+
 # ============== MODELS ==============
 
 class StatusCheck(BaseModel):
@@ -72,27 +597,59 @@ class QRCodeItem(BaseModel):
     content: str
     content_type: str = "url"  # url, text, email, phone, wifi
 
-class QRCodeRequest(BaseModel):
-    items: List[QRCodeItem]  # Support multiple QR codes
+class QRCodeOptions(BaseModel):
     fg_color: str = "#000000"
     bg_color: str = "#FFFFFF"
     size: int = 300
     use_isgd: bool = True  # Use is.gd for URL shortening
+    format: str = "png"  # png or svg
+    profile: str = "balanced"  # fast, balanced, smallest (see QR_OUTPUT_PROFILES)
+    error_correction: Optional[str] = None  # L, M, Q, H (defaults to the profile's)
+    compress_level: Optional[int] = None  # PNG zlib level 0-9 (defaults to the profile's)
+    optimize: Optional[bool] = None  # PNG optimize pass (defaults to the profile's)
+
+class QRCodeRequest(QRCodeOptions):
+    items: List[QRCodeItem]  # Support multiple QR codes
+
+class QRCodeImageRequest(QRCodeOptions):
+    content: str
+    content_type: str = "url"  # url, text, email, phone, wifi
 
 class QRCodeResultItem(BaseModel):
     original_content: str
     final_content: str
     image_base64: str
+    mime_type: str = "image/png"
     success: bool
     error: Optional[str] = None
 
 class QRCodeResponse(BaseModel):
     results: List[QRCodeResultItem]
 
+class QRCodeStreamItem(QRCodeResultItem):
+    index: int  # Position of the item in the request
+
+# Job Models
+class JobStatus(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    kind: str  # qr, webp
+    status: str  # queued, running, completed, failed
+    total: int
+    processed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+    completed_at: Optional[str] = None
+    download_url: Optional[str] = None
+
 # Shortlink Models
 class ShortlinkCreate(BaseModel):
     urls: List[str]  # Support multiple URLs
     use_isgd: bool = True  # Use is.gd API
+    provider: Optional[str] = None  # isgd, local, random; overrides use_isgd when set
 
 class ShortlinkItem(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -100,7 +657,7 @@ class ShortlinkItem(BaseModel):
     original_url: str
     short_url: str
     short_code: str
-    provider: str  # "isgd" or "local"
+    provider: str  # "isgd", "local" or "random"
     clicks: int = 0
     created_at: str
 
@@ -114,6 +671,15 @@ class Shortlink(BaseModel):
     clicks: int = 0
     created_at: str
 
+class ClickBucket(BaseModel):
+    hour: str
+    clicks: int
+
+class ShortlinkClicks(BaseModel):
+    short_code: str
+    total: int
+    buckets: List[ClickBucket]
+
 # Text to HTML Models
 class TextToHTMLRequest(BaseModel):
     text: str
@@ -180,293 +746,1784 @@ async def get_status_checks():
             check['timestamp'] = datetime.fromisoformat(check['timestamp'])
     return status_checks
 
+# ============== JOBS ==============
+
+# Spool directory for job inputs, checkpointed chunk outputs and artifacts
+JOBS_DIR = Path(os.environ.get('JOBS_DIR', ROOT_DIR / 'data' / 'jobs'))
+JOB_CHUNK_SIZE = int(os.environ.get('JOB_CHUNK_SIZE', '500'))
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '32'))
+
+class JobRunner:
+    """Background worker for long-running jobs kept in ``db.jobs``.
+
+    Jobs are claimed atomically with a lease, so several uvicorn workers can
+    share the queue. Handlers process a job in chunks and call ``checkpoint``
+    after each one, which records progress and renews the lease. A job whose
+    lease expires (the process died) is picked up again and resumes from its
+    last checkpoint.
+    """
+
+    def __init__(self, poll_interval: float = 2.0, lease_seconds: float = 60.0):
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.handlers = {}
+        self._task = None
+        self._current_job_id = None
+        self._wake = asyncio.Event()
+
+    def register(self, kind: str, handler):
+        """``handler(job)`` runs a claimed job to completion"""
+        self.handlers[kind] = handler
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def notify(self):
+        """Wake the worker right away instead of at the next poll"""
+        self._wake.set()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._current_job_id is not None:
+            # Hand the job back immediately rather than waiting for the lease to expire
+            await db.jobs.update_one(
+                {"id": self._current_job_id, "worker_id": self.worker_id},
+                {"$set": {"lease_until": datetime.now(timezone.utc)}},
+            )
+            self._current_job_id = None
+
+    async def _loop(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Job claim failed: %s", e)
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._current_job_id = job["id"]
+            try:
+                await self.handlers[job["kind"]](job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.getLogger(__name__).exception("Job %s failed", job["id"])
+                await self.finish(job["id"], "failed", error=str(e))
+            self._current_job_id = None
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await db.jobs.find_one_and_update(
+            {
+                "kind": {"$in": list(self.handlers)},
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_until": {"$lt": now}},
+                ],
+            },
+            {"$set": {
+                "status": "running",
+                "worker_id": self.worker_id,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "updated_at": now.isoformat(),
+            }},
+            sort=[("created_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def checkpoint(self, job_id: str, **progress) -> bool:
+        """Persist progress and renew the lease. False means the job is no longer ours."""
+        now = datetime.now(timezone.utc)
+        result = await db.jobs.update_one(
+            {"id": job_id, "worker_id": self.worker_id, "status": "running"},
+            {"$set": {
+                **progress,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "updated_at": now.isoformat(),
+            }},
+        )
+        return result.matched_count == 1
+
+    async def finish(self, job_id: str, status: str, **fields):
+        now = datetime.now(timezone.utc).isoformat()
+        await db.jobs.update_one(
+            {"id": job_id, "worker_id": self.worker_id},
+            {"$set": {**fields, "status": status, "updated_at": now, "completed_at": now},
+             "$unset": {"lease_until": ""}},
+        )
+
+job_runner = JobRunner(
+    poll_interval=float(os.environ.get('JOB_POLL_INTERVAL', '2')),
+    lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', '60')),
+)
+
+def job_dir(job_id: str) -> Path:
+    return JOBS_DIR / job_id
+
+async def spool_upload(file: UploadFile, path: Path, max_bytes: int) -> int:
+    """Copy an upload to disk in chunks, refusing it once it exceeds max_bytes"""
+    written = 0
+    with open(path, "wb") as out:
+        while chunk := await file.read(1024 * 1024):
+            written += len(chunk)
+            if written > max_bytes:
+                raise HTTPException(
+                    status_code=413, detail=f"Upload exceeds {max_bytes // (1024 * 1024)}MB limit"
+                )
+            out.write(chunk)
+    return written
+
+async def create_job(job_id: str, kind: str, total: int, options: dict) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "options": options,
+        "total": total,
+        "processed": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "next_chunk": 0,
+        "next_offset": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db.jobs.insert_one(job)
+    job_runner.notify()
+    return job
+
+def job_status(job: dict) -> JobStatus:
+    status = JobStatus(**job)
+    if status.status == "completed":
+        status.download_url = f"/api/jobs/{status.id}/download"
+    return status
+
+def read_jsonl_chunk(path: Path, offset: int, limit: int) -> tuple:
+    """Read up to ``limit`` JSON lines starting at byte ``offset``. Returns (rows, next_offset)."""
+    rows = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while len(rows) < limit:
+            line = f.readline()
+            if not line:
+                break
+            rows.append(json.loads(line))
+        return rows, f.tell()
+
+def write_zip_atomic(path: Path, entries: List[tuple], compression: int = zipfile.ZIP_STORED):
+    """Write (name, bytes) entries to a ZIP, replacing ``path`` only once complete"""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with zipfile.ZipFile(tmp_path, "w", compression=compression) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    os.replace(tmp_path, path)
+
+def assemble_job_artifact(directory: Path, manifest_name: str, manifest_fields: List[str]) -> Path:
+    """Merge checkpointed part archives and their manifests into result.zip"""
+    result_path = directory / "result.zip"
+    tmp_path = directory / ".result.zip.tmp"
+    parts = sorted((directory / "parts").glob("part-*.zip"))
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        manifest = io.StringIO()
+        writer = csv.DictWriter(manifest, fieldnames=manifest_fields, extrasaction="ignore")
+        writer.writeheader()
+        for part in parts:
+            with zipfile.ZipFile(part) as part_archive:
+                for info in part_archive.infolist():
+                    if info.filename == "manifest.jsonl":
+                        for line in part_archive.read(info).splitlines():
+                            writer.writerow(json.loads(line))
+                    else:
+                        with part_archive.open(info) as src, archive.open(info.filename, "w") as dst:
+                            shutil.copyfileobj(src, dst)
+        archive.writestr(manifest_name, manifest.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(tmp_path, result_path)
+    shutil.rmtree(directory / "parts", ignore_errors=True)
+    return result_path
+
+async def run_chunked_job(job: dict, process_chunk, manifest_fields: List[str]):
+    """Drive a job through its input.jsonl in checkpointed chunks.
+
+    ``process_chunk(job, start_row, rows)`` returns a list of ``(name, bytes)``
+    archive entries and a list of manifest rows (dicts with a ``success``
+    key). Each chunk is written to ``parts/`` before the checkpoint that
+    skips it, so a crash at any point at most repeats one chunk.
+    """
+    directory = job_dir(job["id"])
+    (directory / "parts").mkdir(parents=True, exist_ok=True)
+    chunk_index = job["next_chunk"]
+    offset = job["next_offset"]
+    progress = {key: job[key] for key in ("processed", "succeeded", "failed")}
+    while progress["processed"] < job["total"]:
+        rows, next_offset = await asyncio.to_thread(
+            read_jsonl_chunk, directory / "input.jsonl", offset, JOB_CHUNK_SIZE
+        )
+        if not rows:
+            break
+        entries, manifest = await process_chunk(job, progress["processed"], rows)
+        manifest_data = "".join(json.dumps(row) + "\n" for row in manifest).encode()
+        entries.append(("manifest.jsonl", manifest_data))
+        await asyncio.to_thread(
+            write_zip_atomic, directory / "parts" / f"part-{chunk_index:06d}.zip", entries
+        )
+        succeeded = sum(1 for row in manifest if row["success"])
+        progress["processed"] += len(rows)
+        progress["succeeded"] += succeeded
+        progress["failed"] += len(rows) - succeeded
+        chunk_index += 1
+        offset = next_offset
+        if not await job_runner.checkpoint(job["id"], next_chunk=chunk_index, next_offset=offset, **progress):
+            return
+    await asyncio.to_thread(assemble_job_artifact, directory, "manifest.csv", manifest_fields)
+    await job_runner.finish(job["id"], "completed", **progress)
+    (directory / "input.jsonl").unlink(missing_ok=True)
+    # Spooled input files, for jobs that have them
+    shutil.rmtree(directory / "inputs", ignore_errors=True)
+
+@api_router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+@api_router.get("/jobs/{job_id}/download")
+async def download_job(job_id: str):
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0, "status": 1, "kind": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return FileResponse(
+        job_dir(job_id) / "result.zip",
+        media_type="application/zip",
+        filename=f"{job['kind']}-{job_id}.zip",
+    )
+
 # ============== QR CODE ==============
 
+# Bump when the rendered bytes change so stale disk-cache entries are not reused
+QR_RENDER_VERSION = 2
+
+QR_ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Output profiles: error correction and PNG encoder settings. Images are always
+# written as 1-bit black/white or 2-entry palette PNGs.
+QR_OUTPUT_PROFILES = {
+    "fast": {"error_correction": "M", "compress_level": 1, "optimize": False},
+    "balanced": {"error_correction": "M", "compress_level": 6, "optimize": False},
+    "smallest": {"error_correction": "L", "compress_level": 9, "optimize": True},
+}
+
+QR_MIME_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+class QRRenderOptions(NamedTuple):
+    """Everything besides the content that affects a rendered QR image"""
+    format: str
+    fg_color: str
+    bg_color: str
+    size: int
+    error_correction: str = "M"
+    compress_level: int = 6
+    optimize: bool = False
+
+def resolve_qr_render_options(request: QRCodeOptions) -> QRRenderOptions:
+    if request.format not in QR_MIME_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'png' or 'svg'")
+    profile = QR_OUTPUT_PROFILES.get(request.profile)
+    if profile is None:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{request.profile}'")
+    error_correction = (request.error_correction or profile["error_correction"]).upper()
+    if error_correction not in QR_ERROR_CORRECTION_LEVELS:
+        raise HTTPException(status_code=400, detail="error_correction must be one of L, M, Q, H")
+    compress_level = profile["compress_level"] if request.compress_level is None else request.compress_level
+    if not 0 <= compress_level <= 9:
+        raise HTTPException(status_code=400, detail="compress_level must be between 0 and 9")
+    return QRRenderOptions(
+        format=request.format,
+        fg_color=request.fg_color.lower(),
+        bg_color=request.bg_color.lower(),
+        size=request.size,
+        error_correction=error_correction,
+        compress_level=compress_level,
+        optimize=profile["optimize"] if request.optimize is None else request.optimize,
+    )
+
+def parse_qr_color(color: str) -> tuple:
+    """Parse a CSS-style colour (or "transparent") to an RGBA tuple"""
+    if color.strip().lower() == "transparent":
+        return (255, 255, 255, 0)
+    return ImageColor.getcolor(color, "RGBA")
+
+def build_qr_matrix(final_content: str, error_correction: str = "M") -> np.ndarray:
+    """Encode content into a boolean module matrix (True = dark), quiet zone included"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=QR_ERROR_CORRECTION_LEVELS[error_correction],
+        border=4,
+    )
+    qr.add_data(final_content)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+def rasterize_qr_matrix(matrix: np.ndarray, size: int) -> np.ndarray:
+    """Scale a module matrix straight to a size x size boolean pixel grid.
+
+    Each module becomes an integer number of pixels and the leftover pixels
+    are split evenly as extra quiet zone, so module edges stay sharp. When the
+    target is smaller than one pixel per module, pixels are sampled
+    nearest-neighbour instead.
+    """
+    modules = matrix.shape[0]
+    scale = size // modules
+    if scale == 0:
+        index = np.arange(size) * modules // size
+        return matrix[np.ix_(index, index)]
+    pixels = matrix.repeat(scale, axis=0).repeat(scale, axis=1)
+    pad = size - modules * scale
+    if pad:
+        before = pad // 2
+        pixels = np.pad(pixels, ((before, pad - before), (before, pad - before)), constant_values=False)
+    return pixels
+
+def render_qr_png(final_content: str, options: QRRenderOptions) -> bytes:
+    """Render a QR code to PNG bytes"""
+    pixels = rasterize_qr_matrix(build_qr_matrix(final_content, options.error_correction), options.size)
+    
+    fg = parse_qr_color(options.fg_color)
+    bg = parse_qr_color(options.bg_color)
+    save_kwargs = {"compress_level": options.compress_level, "optimize": options.optimize}
+    if fg == (0, 0, 0, 255) and bg == (255, 255, 255, 255):
+        # Plain black on white: 1-bit image, light pixels are True
+        img = Image.fromarray(~pixels)
+    else:
+        # Two-entry palette (index 0 = background, 1 = foreground); PIL
+        # writes it as a 1-bit paletted PNG
+        img = Image.fromarray(pixels.view(np.uint8), "L")
+        img.putpalette(bg[:3] + fg[:3])
+        if bg[3] < 255 or fg[3] < 255:
+            save_kwargs["transparency"] = bytes([bg[3], fg[3]])
+    
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', **save_kwargs)
+    return buffer.getvalue()
+
+def _svg_fill(color: tuple) -> str:
+    fill = f'fill="#{color[0]:02x}{color[1]:02x}{color[2]:02x}"'
+    if color[3] < 255:
+        fill += f' fill-opacity="{color[3] / 255:.3f}"'
+    return fill
+
+def render_qr_svg(final_content: str, options: QRRenderOptions) -> bytes:
+    """Render a QR code as an SVG document.
+
+    Each row's runs of dark modules become one rectangle path segment, drawn
+    in module units and scaled by the viewBox, so no raster is ever built.
+    """
+    matrix = build_qr_matrix(final_content, options.error_correction)
+    modules = matrix.shape[0]
+    segments = []
+    for y, row in enumerate(matrix):
+        # Indices where the row switches between light and dark
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], row, [False])).view(np.int8)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            segments.append(f"M{start} {y}h{end - start}v1H{start}z")
+    
+    fg = parse_qr_color(options.fg_color)
+    bg = parse_qr_color(options.bg_color)
+    background = f'<rect width="{modules}" height="{modules}" {_svg_fill(bg)}/>' if bg[3] else ""
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {modules} {modules}" '
+        f'width="{options.size}" height="{options.size}" shape-rendering="crispEdges">'
+        f'{background}<path {_svg_fill(fg)} d="{"".join(segments)}"/></svg>'
+    )
+    return svg.encode()
+
+def render_qr(final_content: str, options: QRRenderOptions) -> bytes:
+    """Render a QR code in the requested format. Runs inside the QR worker pool."""
+    if options.format == "svg":
+        return render_qr_svg(final_content, options)
+    return render_qr_png(final_content, options)
+
+# Rendered QR images keyed by everything that affects their bytes. The disk
+# tier is only enabled when QR_CACHE_DIR is set.
+qr_image_cache = TieredCache(
+    LRUCache(
+        max_entries=int(os.environ.get('QR_CACHE_MAX_ENTRIES', '10000')),
+        max_bytes=int(os.environ.get('QR_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ),
+    DiskCache(
+        os.environ['QR_CACHE_DIR'],
+        max_bytes=int(os.environ.get('QR_CACHE_DISK_MAX_BYTES', str(1024 * 1024 * 1024))),
+    ) if os.environ.get('QR_CACHE_DIR') else None,
+)
+
+async def render_qr_cached(final_content: str, options: QRRenderOptions) -> bytes:
+    key = cache_key(QR_RENDER_VERSION, final_content, *options)
+    return await qr_image_cache.get_or_create(
+        key,
+        lambda: qr_render_pool.run(render_qr, final_content, options),
+    )
+
+async def prepare_qr_content(item: QRCodeItem, use_isgd: bool) -> str:
+    """Build the string that gets encoded for an item, based on its type"""
+    content = item.content
+    final_content = content
+    
+    if item.content_type == "email":
+        final_content = f"mailto:{content}"
+    elif item.content_type == "phone":
+        final_content = f"tel:{content}"
+    elif item.content_type == "wifi":
+        # Expected format: SSID,password,encryption(WPA/WEP/nopass)
+        parts = content.split(",")
+        if len(parts) >= 2:
+            ssid = parts[0]
+            password = parts[1] if len(parts) > 1 else ""
+            encryption = parts[2] if len(parts) > 2 else "WPA"
+            final_content = f"WIFI:T:{encryption};S:{ssid};P:{password};;"
+    elif item.content_type == "url" and use_isgd:
+        # Shorten URL with is.gd first
+        isgd_result = await shorten_with_isgd(content)
+        if isgd_result["success"]:
+            final_content = isgd_result["short_url"]
+    
+    return final_content
+
+async def render_qr_item(item: QRCodeItem, request: QRCodeOptions, options: QRRenderOptions,
+                         use_cache: bool = True) -> tuple:
+    """Prepare and render one item. Returns (final_content, image, error); image is None on failure."""
+    try:
+        final_content = await prepare_qr_content(item, request.use_isgd)
+        if use_cache:
+            image = await render_qr_cached(final_content, options)
+        else:
+            image = await qr_render_pool.run(render_qr, final_content, options)
+        return final_content, image, None
+    except asyncio.TimeoutError:
+        return "", None, "QR rendering timed out"
+    except Exception as e:
+        return "", None, str(e)
+
+async def generate_qr_item(item: QRCodeItem, request: QRCodeRequest,
+                           options: QRRenderOptions) -> QRCodeResultItem:
+    final_content, image, error = await render_qr_item(item, request, options)
+    if image is None:
+        return QRCodeResultItem(
+            original_content=item.content,
+            final_content="",
+            image_base64="",
+            success=False,
+            error=error
+        )
+    return QRCodeResultItem(
+        original_content=item.content,
+        final_content=final_content,
+        image_base64=base64.b64encode(image).decode(),
+        mime_type=QR_MIME_TYPES[options.format],
+        success=True
+    )
+
 @api_router.post("/qr/generate", response_model=QRCodeResponse)
 async def generate_qr_codes(request: QRCodeRequest):
-    results = []
-    
-    for item in request.items:
-        try:
-            # Prepare content based on type
-            content = item.content
-            final_content = content
-            
-            if item.content_type == "email":
-                final_content = f"mailto:{content}"
-            elif item.content_type == "phone":
-                final_content = f"tel:{content}"
-            elif item.content_type == "wifi":
-                # Expected format: SSID,password,encryption(WPA/WEP/nopass)
-                parts = content.split(",")
-                if len(parts) >= 2:
-                    ssid = parts[0]
-                    password = parts[1] if len(parts) > 1 else ""
-                    encryption = parts[2] if len(parts) > 2 else "WPA"
-                    final_content = f"WIFI:T:{encryption};S:{ssid};P:{password};;"
-            elif item.content_type == "url" and request.use_isgd:
-                # Shorten URL with is.gd first
-                isgd_result = await shorten_with_isgd(content)
-                if isgd_result["success"]:
-                    final_content = isgd_result["short_url"]
-            
-            # Generate QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                box_size=10,
-                border=4,
+    options = resolve_qr_render_options(request)
+    # Items are rendered concurrently in the worker pool; gather keeps input order
+    results = await asyncio.gather(*(generate_qr_item(item, request, options) for item in request.items))
+    return QRCodeResponse(results=list(results))
+
+async def stream_qr_ndjson(request: QRCodeRequest, options: QRRenderOptions):
+    """Yield one JSON line per item as soon as it is rendered"""
+    async def indexed(index: int, item: QRCodeItem):
+        result = await generate_qr_item(item, request, options)
+        return QRCodeStreamItem(index=index, **result.model_dump())
+
+    items = (indexed(index, item) for index, item in enumerate(request.items))
+    async for result in as_completed_bounded(items):
+        yield result.model_dump_json() + "\n"
+
+@api_router.post("/qr/generate/stream")
+async def generate_qr_stream(request: QRCodeRequest):
+    """Streaming variant of /qr/generate: newline-delimited JSON in completion order"""
+    options = resolve_qr_render_options(request)
+    return StreamingResponse(stream_qr_ndjson(request, options), media_type="application/x-ndjson")
+
+@api_router.post("/qr/image")
+async def generate_qr_image(request: QRCodeImageRequest):
+    """Render a single QR code and return the image bytes directly"""
+    options = resolve_qr_render_options(request)
+    item = QRCodeItem(content=request.content, content_type=request.content_type)
+    try:
+        final_content = await prepare_qr_content(item, request.use_isgd)
+        image = await render_qr_cached(final_content, options)
+    except WorkerPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="QR rendering timed out")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=image, media_type=QR_MIME_TYPES[options.format])
+
+async def stream_qr_zip(request: QRCodeRequest, options: QRRenderOptions):
+    """Stream rendered QR codes as a ZIP archive, entries in completion order.
+
+    A manifest.json with per-item results (in input order) is the last entry.
+    """
+    async def indexed(index: int, item: QRCodeItem):
+        return index, item, await render_qr_item(item, request, options)
+
+    archive = ZipStream()
+    manifest = []
+    items = (indexed(index, item) for index, item in enumerate(request.items))
+    async for index, item, (final_content, image, error) in as_completed_bounded(items):
+        entry = {"index": index, "original_content": item.content, "final_content": final_content,
+                 "success": image is not None}
+        if image is None:
+            entry["error"] = error
+        else:
+            entry["file"] = f"qr-code-{index + 1:04d}.{options.format}"
+            yield archive.add(entry["file"], image)
+        manifest.append(entry)
+    manifest.sort(key=lambda entry: entry["index"])
+    yield archive.add("manifest.json", json.dumps(manifest, indent=2).encode(), zipfile.ZIP_DEFLATED)
+    yield archive.close()
+
+@api_router.post("/qr/generate/zip")
+async def generate_qr_zip(request: QRCodeRequest):
+    """Batch variant that streams a ZIP of raw images instead of base64 JSON"""
+    options = resolve_qr_render_options(request)
+    return StreamingResponse(
+        stream_qr_zip(request, options),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="qr-codes.zip"'},
+    )
+
+# Bulk jobs: a CSV with a "content" column and an optional "content_type" column
+QR_JOB_MAX_ROWS = int(os.environ.get('QR_JOB_MAX_ROWS', '200000'))
+QR_JOB_MAX_UPLOAD_BYTES = int(os.environ.get('QR_JOB_MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+QR_JOB_MANIFEST_FIELDS = ["row", "content", "content_type", "final_content", "file", "success", "error"]
+
+def convert_qr_csv(csv_path: Path, jsonl_path: Path, max_rows: int) -> int:
+    """Validate the uploaded CSV and rewrite it as one JSON item per line.
+
+    JSON lines can be resumed from a byte offset, which CSV with quoted
+    newlines cannot. Returns the number of rows.
+    """
+    rows = 0
+    with open(csv_path, newline="", encoding="utf-8-sig") as src, open(jsonl_path, "w") as dst:
+        reader = csv.DictReader(src)
+        fields = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+        if "content" not in fields:
+            raise ValueError("CSV must have a 'content' column")
+        for row in reader:
+            rows += 1
+            if rows > max_rows:
+                raise ValueError(f"CSV exceeds {max_rows} rows")
+            item = QRCodeItem(
+                content=row[fields["content"]] or "",
+                content_type=(row.get(fields.get("content_type", ""), "") or "url").strip(),
             )
-            qr.add_data(final_content)
-            qr.make(fit=True)
-            
-            # Create image with colors
-            img = qr.make_image(fill_color=request.fg_color, back_color=request.bg_color)
-            
-            # Resize to requested size
-            img = img.resize((request.size, request.size), Image.Resampling.LANCZOS)
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            img_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            results.append(QRCodeResultItem(
-                original_content=content,
-                final_content=final_content,
-                image_base64=img_base64,
-                success=True
-            ))
-        except Exception as e:
-            results.append(QRCodeResultItem(
-                original_content=item.content,
-                final_content="",
-                image_base64="",
-                success=False,
-                error=str(e)
-            ))
-    
-    return QRCodeResponse(results=results)
+            dst.write(item.model_dump_json() + "\n")
+    return rows
+
+async def process_qr_job_chunk(job: dict, start_row: int, rows: List[dict]) -> tuple:
+    request = QRCodeOptions(**job["options"])
+    options = resolve_qr_render_options(request)
+
+    async def render_row(row_number: int, item: QRCodeItem):
+        return row_number, item, await render_qr_item(item, request, options, use_cache=False)
+
+    entries = []
+    manifest = []
+    items = (render_row(start_row + i + 1, QRCodeItem(**row)) for i, row in enumerate(rows))
+    async for row_number, item, (final_content, image, error) in as_completed_bounded(items, JOB_CONCURRENCY):
+        entry = {"row": row_number, "content": item.content, "content_type": item.content_type,
+                 "final_content": final_content, "success": image is not None, "error": error}
+        if image is not None:
+            entry["file"] = f"qr-{row_number:06d}.{options.format}"
+            entries.append((entry["file"], image))
+        manifest.append(entry)
+    manifest.sort(key=lambda entry: entry["row"])
+    return entries, manifest
+
+async def run_qr_job(job: dict):
+    await run_chunked_job(job, process_qr_job_chunk, QR_JOB_MANIFEST_FIELDS)
+
+job_runner.register("qr", run_qr_job)
+
+@api_router.post("/qr/jobs", response_model=JobStatus, status_code=202)
+async def create_qr_job(file: UploadFile = File(...), options: str = Form("{}")):
+    """Queue a bulk QR job from a CSV upload; poll /api/jobs/{id} for progress.
+
+    ``options`` is a JSON object with the same fields as a /qr/generate request
+    (minus ``items``).
+    """
+    try:
+        request = QRCodeOptions.model_validate_json(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid options: {e}")
+    resolve_qr_render_options(request)
+
+    job_id = str(uuid.uuid4())
+    directory = job_dir(job_id)
+    directory.mkdir(parents=True)
+    try:
+        await spool_upload(file, directory / "input.csv", QR_JOB_MAX_UPLOAD_BYTES)
+        total = await asyncio.to_thread(
+            convert_qr_csv, directory / "input.csv", directory / "input.jsonl", QR_JOB_MAX_ROWS
+        )
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    (directory / "input.csv").unlink()
+    job = await create_job(job_id, "qr", total, request.model_dump())
+    return job_status(job)
+
+@api_router.get("/qr/cache/stats")
+async def get_qr_cache_stats():
+    return qr_image_cache.stats()
 
 # ============== SHORTLINKS ==============
 
+class ShortlinkError(BaseModel):
+    index: int  # Position of the URL in the request
+    url: str
+    error: str
+
 class ShortlinkCreateResponse(BaseModel):
     results: List[Shortlink]
     success_count: int
     error_count: int
+    errors: List[ShortlinkError] = []
+
+# How many fresh codes to try when a generated short_code is already taken
+SHORT_CODE_ATTEMPTS = 5
+
+BASE62_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+def generate_local_code() -> str:
+    return shortuuid.uuid()[:7]
+
+# Public origin of the top-level /{short_code} redirect, e.g. https://s.example.com
+SHORTLINK_BASE_URL = os.environ.get('SHORTLINK_BASE_URL', '').rstrip('/')
+
+def local_short_url(short_code: str) -> Optional[str]:
+    return f"{SHORTLINK_BASE_URL}/{short_code}" if SHORTLINK_BASE_URL else None
+
+class ShortcodeProvider:
+    """Turns long URLs into short codes.
+
+    ``shorten_many`` returns one ``(short_code, short_url)`` per URL, or
+    ``None`` where the provider could not shorten it (the caller then falls
+    back to the local provider). ``short_url`` is ``None`` for codes served
+    by this app.
+    """
+
+    name = ""
+
+    async def shorten_many(self, urls: List[str]) -> List[Optional[tuple]]:
+        raise NotImplementedError
+
+class IsgdProvider(ShortcodeProvider):
+    name = "isgd"
+
+    async def shorten_many(self, urls: List[str]) -> List[Optional[tuple]]:
+        unique_urls = list(dict.fromkeys(urls))
+        shortened = dict(zip(unique_urls, await isgd_client.shorten_many(unique_urls)))
+        return [
+            (result["short_url"].split("/")[-1], result["short_url"]) if result["success"] else None
+            for result in (shortened[url] for url in urls)
+        ]
+
+class RandomCodeProvider(ShortcodeProvider):
+    """Random 7-character codes; unique only thanks to the short_code index"""
+
+    name = "random"
+
+    async def shorten_many(self, urls: List[str]) -> List[Optional[tuple]]:
+        return [(generate_local_code(), None) for _ in urls]
+
+class CounterBlockProvider(ShortcodeProvider):
+    """Collision-free local codes from a shared counter, allocated hi/lo style.
+
+    Each process reserves a block of ``block_size`` numbers with a single
+    atomic ``$inc`` on ``db.counters`` and then mints codes from it without
+    touching the database. Numbers are permuted over the 7-character base62
+    space by multiplying with a constant coprime to it, so codes are unique
+    but not sequential-looking.
+    """
+
+    name = "local"
+    CODE_LENGTH = 7
+    CODE_SPACE = 62 ** CODE_LENGTH
+    MULTIPLIER = 2654435761  # odd and not a multiple of 31, so coprime to 62**7
+
+    def __init__(self, counter_id: str = "shortlinks", block_size: int = 1000):
+        self.counter_id = counter_id
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def allocate(self, count: int) -> List[int]:
+        numbers = []
+        async with self._lock:
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(numbers))
+                    counter = await db.counters.find_one_and_update(
+                        {"_id": self.counter_id},
+                        {"$inc": {"value": size}},
+                        upsert=True,
+                        return_document=ReturnDocument.AFTER,
+                    )
+                    self._end = counter["value"]
+                    self._next = self._end - size
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        return numbers
+
+    def encode(self, number: int) -> str:
+        value = number * self.MULTIPLIER % self.CODE_SPACE
+        chars = []
+        for _ in range(self.CODE_LENGTH):
+            value, digit = divmod(value, 62)
+            chars.append(BASE62_ALPHABET[digit])
+        return "".join(reversed(chars))
+
+    async def shorten_many(self, urls: List[str]) -> List[Optional[tuple]]:
+        return [(self.encode(number), None) for number in await self.allocate(len(urls))]
+
+local_provider = CounterBlockProvider(block_size=int(os.environ.get('SHORTLINK_COUNTER_BLOCK', '1000')))
+
+SHORTLINK_PROVIDERS = {
+    provider.name: provider
+    for provider in (IsgdProvider(), local_provider, RandomCodeProvider())
+}
+
+async def insert_shortlink(doc: dict) -> dict:
+    """Insert a shortlink, relying on the unique short_code index to detect collisions.
+
+    A colliding code (e.g. a legacy random code) is replaced by a fresh local
+    one. is.gd hands out the same code for the same URL, so a collision with
+    a matching URL returns the existing shortlink.
+    """
+    for _ in range(SHORT_CODE_ATTEMPTS):
+        try:
+            await db.shortlinks.insert_one(doc)
+            doc.pop("_id", None)
+            return doc
+        except DuplicateKeyError:
+            doc.pop("_id", None)
+            if doc["provider"] == "isgd":
+                existing = await db.shortlinks.find_one({"short_code": doc["short_code"]}, {"_id": 0})
+                if existing and existing["original_url"] == doc["original_url"]:
+                    return existing
+            (short_code, short_url), = await local_provider.shorten_many([doc["original_url"]])
+            doc.update(short_code=short_code, short_url=local_short_url(short_code), provider=local_provider.name)
+    raise RuntimeError("Could not allocate a unique short code")
+
+def is_valid_url(url: str) -> bool:
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return False
+    return bool(parsed.scheme and parsed.netloc)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for deduplication (the stored URL is left as given).
+
+    Lowercases scheme and host, drops default ports and trailing slashes, and
+    sorts query parameters.
+    """
+    try:
+        parsed = urlparse(url.strip())
+        scheme = parsed.scheme.lower()
+        host = parsed.hostname or ""
+        port = parsed.port
+    except ValueError:
+        return url
+    if ":" in host:
+        host = f"[{host}]"
+    netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    if parsed.username is not None:
+        userinfo = parsed.username if parsed.password is None else f"{parsed.username}:{parsed.password}"
+        netloc = f"{userinfo}@{netloc}"
+    path = parsed.path.rstrip("/")
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, netloc, path, parsed.params, query, parsed.fragment))
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
 
 @api_router.post("/shortlinks/create", response_model=ShortlinkCreateResponse)
 async def create_shortlinks(request: ShortlinkCreate):
-    results = []
-    success_count = 0
-    error_count = 0
+    """Validate all URLs, shorten the valid ones with the chosen provider, then persist them in one insert_many"""
+    errors = []
+    valid = []  # (index, url)
+    for index, url in enumerate(request.urls):
+        if is_valid_url(url):
+            valid.append((index, url))
+        else:
+            errors.append(ShortlinkError(index=index, url=url, error="Invalid URL"))
+    
+    provider = SHORTLINK_PROVIDERS["isgd" if request.use_isgd else "local"]
+    if request.provider is not None:
+        provider = SHORTLINK_PROVIDERS.get(request.provider)
+        if provider is None:
+            raise HTTPException(
+                status_code=400, detail=f"provider must be one of {', '.join(SHORTLINK_PROVIDERS)}"
+            )
+    
+    # Destinations this provider already shortened are returned as they are;
+    # only the first occurrence of each new destination gets shortened
+    hashes = [url_hash(url) for _, url in valid]
+    existing = {}
+    if hashes:
+        cursor = db.shortlinks.find(
+            {"url_hash": {"$in": list(set(hashes))}, "provider": provider.name},
+            {**SHORTLINK_PROJECTION, "url_hash": 1},
+        )
+        async for shortlink in cursor:
+            existing.setdefault(shortlink.pop("url_hash"), shortlink)
+    pending = {}  # url_hash -> position in valid
+    for position, hash_ in enumerate(hashes):
+        if hash_ not in existing:
+            pending.setdefault(hash_, position)
     
-    for url in request.urls:
+    urls = [valid[position][1] for position in pending.values()]
+    codes = await provider.shorten_many(urls) if urls else []
+    # Anything the provider couldn't shorten gets a local code
+    missing = [position for position, code in enumerate(codes) if code is None]
+    if missing:
+        fallback = await local_provider.shorten_many([urls[position] for position in missing])
+        for position, code in zip(missing, fallback):
+            codes[position] = code
+    fell_back = set(missing)
+    
+    created_at = datetime.now(timezone.utc).isoformat()
+    docs = []
+    for position, (url, hash_, (short_code, short_url)) in enumerate(zip(urls, pending, codes)):
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "original_url": url,
+            "url_hash": hash_,
+            "short_code": short_code,
+            "short_url": short_url or local_short_url(short_code),
+            "provider": local_provider.name if position in fell_back else provider.name,
+            "clicks": 0,
+            "created_at": created_at
+        })
+    
+    # Unordered, so one failing document doesn't stop the rest
+    failed = {}  # position in docs -> error message
+    if docs:
         try:
-            # Validate URL
+            await db.shortlinks.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                failed[write_error["index"]] = write_error
+    
+    created = {}  # url_hash -> stored document or error message
+    for position, (hash_, doc) in enumerate(zip(pending, docs)):
+        doc.pop("_id", None)
+        write_error = failed.get(position)
+        if write_error is not None:
+            if write_error.get("code") != 11000:
+                created[hash_] = write_error.get("errmsg", "Write failed")
+                continue
+            # Short code collision: retry this one with the collision handling
             try:
-                from urllib.parse import urlparse
-                parsed = urlparse(url)
-                if not parsed.scheme or not parsed.netloc:
-                    raise ValueError("Invalid URL")
-            except:
-                error_count += 1
+                doc = await insert_shortlink(doc)
+            except Exception as e:
+                created[hash_] = str(e)
                 continue
-            
-            shortlink_id = str(uuid.uuid4())
-            created_at = datetime.now(timezone.utc).isoformat()
-            
-            if request.use_isgd:
-                # Use is.gd API
-                isgd_result = await shorten_with_isgd(url)
-                if isgd_result["success"]:
-                    short_url = isgd_result["short_url"]
-                    short_code = short_url.split("/")[-1]
-                    provider = "isgd"
-                else:
-                    # Fallback to local
-                    short_code = shortuuid.uuid()[:7]
-                    short_url = None
-                    provider = "local"
-            else:
-                # Local shortlink
-                short_code = shortuuid.uuid()[:7]
-                short_url = None
-                provider = "local"
-            
-            # Save to database
-            shortlink_doc = {
-                "id": shortlink_id,
-                "original_url": url,
-                "short_code": short_code,
-                "short_url": short_url,
-                "provider": provider,
-                "clicks": 0,
-                "created_at": created_at
-            }
-            
-            await db.shortlinks.insert_one(shortlink_doc)
-            
-            results.append(Shortlink(
-                id=shortlink_id,
-                original_url=url,
-                short_code=short_code,
-                short_url=short_url,
-                provider=provider,
-                clicks=0,
-                created_at=created_at
-            ))
-            success_count += 1
-            
-        except Exception as e:
-            error_count += 1
-            continue
+        created[hash_] = doc
     
+    results = []
+    for (index, url), hash_ in zip(valid, hashes):
+        shortlink = existing.get(hash_) or created[hash_]
+        if isinstance(shortlink, str):
+            errors.append(ShortlinkError(index=index, url=url, error=shortlink))
+        else:
+            results.append(Shortlink(**shortlink))
+    
+    errors.sort(key=lambda error: error.index)
     return ShortlinkCreateResponse(
         results=results,
-        success_count=success_count,
-        error_count=error_count
+        success_count=len(results),
+        error_count=len(errors),
+        errors=errors
     )
 
+SHORTLINK_FIELDS = ["id", "original_url", "short_code", "short_url", "provider", "clicks", "created_at"]
+SHORTLINK_PROJECTION = {"_id": 0, **{field: 1 for field in SHORTLINK_FIELDS}}
+SHORTLINK_PAGE_MAX = int(os.environ.get('SHORTLINK_PAGE_MAX', '1000'))
+
+def encode_shortlink_cursor(shortlink: dict) -> str:
+    raw = json.dumps([shortlink["created_at"], shortlink["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_shortlink_cursor(cursor: str) -> tuple:
+    try:
+        created_at, shortlink_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, shortlink_id
+
 @api_router.get("/shortlinks", response_model=List[Shortlink])
-async def get_shortlinks():
-    shortlinks = await db.shortlinks.find({}, {"_id": 0}).to_list(100)
+async def get_shortlinks(response: Response, limit: int = 100, cursor: Optional[str] = None):
+    """Newest shortlinks first, paginated by keyset on (created_at, id).
+
+    When more results exist, the cursor for the next page is returned in the
+    X-Next-Cursor header.
+    """
+    limit = max(1, min(limit, SHORTLINK_PAGE_MAX))
+    query = {}
+    if cursor:
+        created_at, shortlink_id = decode_shortlink_cursor(cursor)
+        query = {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": shortlink_id}},
+        ]}
+    shortlinks = await db.shortlinks.find(query, SHORTLINK_PROJECTION).sort(
+        [("created_at", DESCENDING), ("id", DESCENDING)]
+    ).limit(limit + 1).to_list(limit + 1)
+    if len(shortlinks) > limit:
+        shortlinks = shortlinks[:limit]
+        response.headers["X-Next-Cursor"] = encode_shortlink_cursor(shortlinks[-1])
     return [Shortlink(**sl) for sl in shortlinks]
 
+async def stream_shortlinks_export(export_format: str):
+    """Stream every shortlink straight from the Mongo cursor"""
+    cursor = db.shortlinks.find({}, SHORTLINK_PROJECTION).batch_size(1000)
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=SHORTLINK_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        async for shortlink in cursor:
+            writer.writerow(shortlink)
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        async for shortlink in cursor:
+            yield json.dumps(shortlink) + "\n"
+
+@api_router.get("/shortlinks/export")
+async def export_shortlinks(format: str = "ndjson"):
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_shortlinks_export(format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="shortlinks.{format}"'},
+    )
+
+# short_code -> original_url for the redirect hot path. Mappings don't change
+# after creation; deletes invalidate locally and the TTL bounds staleness
+# across uvicorn workers.
+shortlink_cache = LRUCache(
+    max_entries=int(os.environ.get('SHORTLINK_CACHE_SIZE', '50000')),
+    ttl=float(os.environ.get('SHORTLINK_CACHE_TTL', '300')),
+)
+SHORTLINK_CACHE_PREWARM = int(os.environ.get('SHORTLINK_CACHE_PREWARM', '1000'))
+
+async def resolve_short_code(short_code: str) -> Optional[str]:
+    """Read-through lookup of a short code's destination"""
+    original_url = shortlink_cache.get(short_code)
+    if original_url is None:
+        shortlink = await db.shortlinks.find_one({"short_code": short_code}, {"_id": 0, "original_url": 1})
+        if not shortlink:
+            return None
+        original_url = shortlink["original_url"]
+        shortlink_cache.set(short_code, original_url)
+    return original_url
+
+async def prewarm_shortlink_cache(limit: int):
+    """Load the most-clicked shortlinks into the redirect cache"""
+    cursor = db.shortlinks.find({}, {"_id": 0, "short_code": 1, "original_url": 1}).sort("clicks", -1).limit(limit)
+    async for shortlink in cursor:
+        shortlink_cache.set(shortlink["short_code"], shortlink["original_url"])
+
+class ClickBuffer:
+    """Buffers shortlink clicks in memory and writes them in bulk.
+
+    Each flush issues one ``bulk_write`` of ``$inc`` updates on
+    ``db.shortlinks`` and one of upserts on ``db.shortlink_clicks``, which
+    keeps per-code hourly counters for click-over-time analytics. Flushes
+    happen every ``flush_interval`` seconds, as soon as ``flush_threshold``
+    clicks are pending, and on shutdown.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, flush_threshold: int = 1000):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._clicks = Counter()  # short_code -> clicks
+        self._buckets = Counter()  # (short_code, hour) -> clicks
+        self._pending = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._threshold_flush = None
+
+    def record(self, short_code: str):
+        hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        self._clicks[short_code] += 1
+        self._buckets[(short_code, hour)] += 1
+        self._pending += 1
+        if self._pending >= self.flush_threshold and (
+            self._threshold_flush is None or self._threshold_flush.done()
+        ):
+            self._threshold_flush = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            clicks, buckets = self._clicks, self._buckets
+            self._clicks, self._buckets, self._pending = Counter(), Counter(), 0
+            await self._write(
+                db.shortlinks,
+                [UpdateOne({"short_code": code}, {"$inc": {"clicks": n}}) for code, n in clicks.items()],
+                lambda: self._clicks.update(clicks),
+            )
+            await self._write(
+                db.shortlink_clicks,
+                [UpdateOne({"short_code": code, "hour": hour}, {"$inc": {"clicks": n}}, upsert=True)
+                 for (code, hour), n in buckets.items()],
+                lambda: self._buckets.update(buckets),
+            )
+
+    async def _write(self, collection, operations: list, requeue):
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Part of the batch was applied; retrying it would double count
+            logging.getLogger(__name__).warning("Click flush partially failed: %s", e.details.get("writeErrors"))
+        except Exception as e:
+            logging.getLogger(__name__).warning("Click flush failed, will retry: %s", e)
+            requeue()
+            self._pending = max(self._pending, 1)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+click_buffer = ClickBuffer(
+    flush_interval=float(os.environ.get('CLICK_FLUSH_INTERVAL', '5')),
+    flush_threshold=int(os.environ.get('CLICK_FLUSH_THRESHOLD', '1000')),
+)
+
+@api_router.get("/shortlinks/{short_code}/clicks", response_model=ShortlinkClicks)
+async def get_shortlink_clicks(short_code: str, hours: int = 168):
+    """Hourly click counts for the last ``hours`` hours (up to 90 days)"""
+    hours = max(1, min(hours, 24 * 90))
+    since = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    cursor = db.shortlink_clicks.find(
+        {"short_code": short_code, "hour": {"$gte": since}}, {"_id": 0, "hour": 1, "clicks": 1}
+    ).sort("hour", 1)
+    buckets = [
+        ClickBucket(hour=bucket["hour"].replace(tzinfo=timezone.utc).isoformat(), clicks=bucket["clicks"])
+        async for bucket in cursor
+    ]
+    return ShortlinkClicks(short_code=short_code, total=sum(b.clicks for b in buckets), buckets=buckets)
+
 @api_router.get("/shortlinks/{short_code}")
 async def redirect_shortlink(short_code: str):
-    shortlink = await db.shortlinks.find_one({"short_code": short_code})
-    if not shortlink:
+    original_url = await resolve_short_code(short_code)
+    if original_url is None:
         raise HTTPException(status_code=404, detail="Shortlink not found")
     
-    # Increment clicks
-    await db.shortlinks.update_one(
-        {"short_code": short_code},
-        {"$inc": {"clicks": 1}}
-    )
+    # Counted in memory and flushed in bulk
+    click_buffer.record(short_code)
     
-    return {"original_url": shortlink["original_url"]}
+    return {"original_url": original_url}
+
+# 302 keeps every visit flowing through here (and counted); 301 lets browsers
+# and the proxy cache the redirect, so repeat visits are not counted
+SHORTLINK_REDIRECT_STATUS = int(os.environ.get('SHORTLINK_REDIRECT_STATUS', '302'))
+SHORTLINK_REDIRECT_CACHE_CONTROL = os.environ.get(
+    'SHORTLINK_REDIRECT_CACHE_CONTROL',
+    'public, max-age=86400' if SHORTLINK_REDIRECT_STATUS in (301, 308) else 'private, no-cache',
+)
+
+@app.get("/{short_code}", include_in_schema=False)
+async def follow_shortlink(short_code: str):
+    """Bare HTTP redirect for short URLs served by this app"""
+    original_url = await resolve_short_code(short_code)
+    if original_url is None:
+        return Response(status_code=404, headers={"Cache-Control": "no-store"})
+    return Response(
+        status_code=SHORTLINK_REDIRECT_STATUS,
+        headers={"Location": original_url, "Cache-Control": SHORTLINK_REDIRECT_CACHE_CONTROL},
+        background=BackgroundTask(click_buffer.record, short_code),
+    )
 
 @api_router.delete("/shortlinks/{shortlink_id}")
 async def delete_shortlink(shortlink_id: str):
-    result = await db.shortlinks.delete_one({"id": shortlink_id})
-    if result.deleted_count == 0:
+    shortlink = await db.shortlinks.find_one_and_delete({"id": shortlink_id}, {"_id": 0, "short_code": 1})
+    if not shortlink:
         raise HTTPException(status_code=404, detail="Shortlink not found")
+    shortlink_cache.pop(shortlink["short_code"])
+    await db.shortlink_clicks.delete_many({"short_code": shortlink["short_code"]})
     return {"message": "Shortlink deleted"}
 
 # ============== IMAGE CONVERTER ==============
 
-@api_router.post("/images/convert-to-webp")
-async def convert_images_to_webp(files: List[UploadFile] = File(...)):
-    if len(files) > 10:
-        raise HTTPException(status_code=400, detail="Maximum 10 images allowed per batch")
-    
-    converted_images = []
-    
-    for file in files:
+IMAGE_MAX_FILES = 10
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+# Uploads are copied here so worker processes can decode them from a path
+IMAGE_SPOOL_DIR = os.environ.get('IMAGE_SPOOL_DIR') or tempfile.gettempdir()
+
+class UploadSizeLimit:
+    """ASGI middleware rejecting requests whose Content-Length is over a per-path limit.
+
+    This stops oversized uploads before their body is read. Chunked requests
+    carry no Content-Length and are checked per file while they are spooled.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits  # path prefix -> max bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limit = next((size for prefix, size in self.limits.items() if scope["path"].startswith(prefix)), None)
+            if limit is not None:
+                length = dict(scope["headers"]).get(b"content-length")
+                if length is not None and length.isdigit() and int(length) > limit:
+                    body = json.dumps({"detail": f"Request exceeds {limit // (1024 * 1024)}MB limit"}).encode()
+                    await send({
+                        "type": "http.response.start",
+                        "status": 413,
+                        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+                    })
+                    await send({"type": "http.response.body", "body": body})
+                    return
+        await self.app(scope, receive, send)
+
+# Largest image accepted at all; Pillow refuses anything over twice this in
+# any code path that opens images (DecompressionBombError)
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', '50000000'))
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+class PixelBudgetExceeded(Exception):
+    """Raised when an image waited too long for room in the pixel budget"""
+
+class PixelBudget:
+    """Admission control on the number of pixels being decoded at once.
+
+    Decoded images cost about 4 bytes per pixel however small the file was,
+    so conversions reserve their pixel count up front (from the image header)
+    and wait, first come first served, until it fits under ``max_pixels``.
+    Callers waiting longer than ``max_wait`` seconds get ``PixelBudgetExceeded``.
+    """
+
+    def __init__(self, max_pixels: int, max_wait: float = 10.0):
+        self.max_pixels = max_pixels
+        self.max_wait = max_wait
+        self.in_use = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters = deque()  # (pixels, future)
+
+    async def acquire(self, pixels: int):
+        if pixels > self.max_pixels:
+            raise ValueError(f"Image needs {pixels} pixels, more than the {self.max_pixels} pixel budget")
+        if not self._waiters and self.in_use + pixels <= self.max_pixels:
+            self.in_use += pixels
+            self.admitted += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((pixels, future))
         try:
-            # Check file size (5MB limit)
-            content = await file.read()
-            if len(content) > 5 * 1024 * 1024:
-                converted_images.append({
-                    "original_name": file.filename,
-                    "success": False,
-                    "error": "File exceeds 5MB limit"
-                })
+            await asyncio.wait_for(future, self.max_wait)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Admitted just as we gave up
+                self.release(pixels)
+            else:
+                future.cancel()
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise PixelBudgetExceeded("Image conversion is at capacity, try again later") from None
+            raise
+        self.admitted += 1
+
+    def release(self, pixels: int):
+        self.in_use -= pixels
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            pixels, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
                 continue
-            
-            # Convert to WebP
-            image = Image.open(io.BytesIO(content))
-            
-            # Convert to RGB if necessary (for PNG with transparency, etc.)
-            if image.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Save as WebP with 75% quality for smaller files
-            buffer = io.BytesIO()
-            image.save(buffer, format='WEBP', quality=75)
-            buffer.seek(0)
-            
-            # Convert to base64
-            webp_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            original_name = file.filename or "image"
-            new_name = os.path.splitext(original_name)[0] + ".webp"
-            
-            converted_images.append({
-                "original_name": original_name,
-                "new_name": new_name,
-                "success": True,
-                "webp_base64": webp_base64,
-                "size_bytes": len(buffer.getvalue())
-            })
-            
-        except Exception as e:
-            converted_images.append({
-                "original_name": file.filename,
-                "success": False,
-                "error": str(e)
-            })
+            if self.in_use + pixels > self.max_pixels:
+                break
+            self._waiters.popleft()
+            self.in_use += pixels
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "max_pixels": self.max_pixels,
+            "in_use": self.in_use,
+            "waiting": sum(1 for _, future in self._waiters if not future.done()),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+pixel_budget = PixelBudget(
+    max_pixels=int(os.environ.get('IMAGE_PIXEL_BUDGET', '200000000')),
+    max_wait=float(os.environ.get('IMAGE_PIXEL_BUDGET_WAIT', '10')),
+)
+# Seconds clients are told to back off when the budget is exhausted
+IMAGE_RETRY_AFTER = int(os.environ.get('IMAGE_RETRY_AFTER', '5'))
+
+def decoded_pixels(path, max_dimension: int = 0) -> int:
+    """Pixels convert_to_webp will hold for an image, read from its header only"""
+    with Image.open(path) as image:
+        width, height = image.size
+        if width * height > IMAGE_MAX_PIXELS:
+            raise ValueError(f"Image exceeds the {IMAGE_MAX_PIXELS // 1_000_000} megapixel limit")
+        scale = 1
+        if max_dimension and image.format == "JPEG":
+            # Mirrors the scale Image.draft picks in convert_to_webp
+            ratio = min(width // max_dimension, height // max_dimension)
+            while scale < 8 and scale * 2 <= ratio:
+                scale *= 2
+    return -(-width // scale) * -(-height // scale)
+
+# method trades encoding time for size (0 = fastest, 6 = smallest); for
+# lossless, quality is the compression effort rather than fidelity
+WEBP_PRESETS = {
+    "fast": {"quality": 75, "method": 0, "lossless": False},
+    "balanced": {"quality": 75, "method": 4, "lossless": False},
+    "smallest": {"quality": 60, "method": 6, "lossless": False},
+    "lossless": {"quality": 80, "method": 4, "lossless": True},
+}
+
+class WebPOptions(NamedTuple):
+    """Everything besides the input that affects a converted WebP image"""
+    quality: int = 75
+    method: int = 4
+    lossless: bool = False
+    keep_alpha: bool = False
+    max_dimension: int = 0
+
+def resolve_webp_options(preset: str = "balanced", quality: Optional[int] = None,
+                         keep_alpha: bool = False, max_dimension: int = 0) -> WebPOptions:
+    settings = WEBP_PRESETS.get(preset)
+    if settings is None:
+        raise HTTPException(status_code=400, detail=f"preset must be one of {', '.join(WEBP_PRESETS)}")
+    if quality is not None and not 0 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality must be between 0 and 100")
+    if not 0 <= max_dimension <= 16384:
+        raise HTTPException(status_code=400, detail="max_dimension must be between 0 (no resize) and 16384")
+    return WebPOptions(
+        quality=settings["quality"] if quality is None else quality,
+        method=settings["method"],
+        lossless=settings["lossless"],
+        keep_alpha=keep_alpha,
+        max_dimension=max_dimension,
+    )
+
+def convert_to_webp(path: str, options: WebPOptions) -> bytes:
+    """Decode an image file, drop or keep its alpha and encode it as WebP (runs in image_pool)"""
+    max_dimension = options.max_dimension
+    with Image.open(path) as image:
+        if max_dimension:
+            # JPEGs decode straight at 1/2, 1/4 or 1/8 scale; a no-op for other formats
+            image.draft("RGB", (max_dimension, max_dimension))
+            if max(image.size) > max_dimension:
+                # reduce()s by an integer factor first, then resamples the small image
+                image.thumbnail((max_dimension, max_dimension), reducing_gap=2.0)
+        
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+        if has_alpha and options.keep_alpha:
+            # WebP stores alpha natively, no background to composite onto
+            if image.mode != 'RGBA':
+                image = image.convert('RGBA')
+        elif image.mode in ('RGBA', 'LA', 'PA', 'P'):
+            # Flatten transparency onto white; the RGBA image doubles as its own paste mask
+            if image.mode != 'RGBA':
+                image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image)
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        buffer = io.BytesIO()
+        image.save(buffer, format='WEBP', quality=options.quality, method=options.method, lossless=options.lossless)
+        return buffer.getvalue()
+
+def webp_filename(original_name: str) -> str:
+    """Archive entry name for a converted upload, without any client-supplied directories"""
+    stem = os.path.splitext(re.split(r"[\\/]", original_name)[-1])[0]
+    return f"{stem or 'image'}.webp"
+
+def spool_path() -> Path:
+    return Path(IMAGE_SPOOL_DIR) / f"upload-{uuid.uuid4().hex}"
+
+async def spool_image(file: UploadFile, path: Path) -> Optional[str]:
+    """Copy an upload to ``path``. Returns an error message if it is too large."""
+    try:
+        if file.size is not None and file.size > IMAGE_MAX_BYTES:
+            return "File exceeds 5MB limit"
+        try:
+            await spool_upload(file, path, IMAGE_MAX_BYTES)
+        except HTTPException:
+            return "File exceeds 5MB limit"
+    finally:
+        await file.close()
+    return None
+
+# Bump when convert_to_webp output changes, to invalidate cached conversions
+WEBP_CONVERT_VERSION = 1
+
+# Re-uploads of the same file with the same options skip decoding and
+# encoding. The disk tier is on by default; set WEBP_CACHE_DIR empty to disable it.
+WEBP_CACHE_DIR = os.environ.get('WEBP_CACHE_DIR', str(ROOT_DIR / 'data' / 'webp-cache'))
+webp_cache = TieredCache(
+    LRUCache(
+        max_entries=int(os.environ.get('WEBP_CACHE_MAX_ENTRIES', '1000')),
+        max_bytes=int(os.environ.get('WEBP_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    ),
+    DiskCache(
+        WEBP_CACHE_DIR,
+        max_bytes=int(os.environ.get('WEBP_CACHE_DISK_MAX_BYTES', str(1024 * 1024 * 1024))),
+        suffix=".webp",
+    ) if WEBP_CACHE_DIR else None,
+)
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def convert_within_budget(path: Path, options: WebPOptions) -> bytes:
+    pixels = decoded_pixels(path, options.max_dimension)
+    # Held until the worker is really done with the image, even after a timeout
+    await pixel_budget.acquire(pixels)
+    return await image_pool.run(
+        convert_to_webp, str(path), options, on_done=lambda: pixel_budget.release(pixels)
+    )
+
+async def convert_spooled_image(path: Path, options: WebPOptions, use_cache: bool = True) -> tuple:
+    """Convert a spooled upload, through the cache and within the pixel budget.
+
+    Returns (webp, error); webp is None on failure. ``PixelBudgetExceeded``
+    is raised rather than reported, so callers can turn it into a 429.
+    """
+    try:
+        if use_cache:
+            key = cache_key(WEBP_CONVERT_VERSION, await asyncio.to_thread(file_sha256, path), *options)
+            webp = await webp_cache.get_or_create(key, lambda: convert_within_budget(path, options))
+        else:
+            webp = await convert_within_budget(path, options)
+        return webp, None
+    except PixelBudgetExceeded:
+        raise
+    except asyncio.TimeoutError:
+        return None, "Image conversion timed out"
+    except UnidentifiedImageError:
+        # Pillow's message would leak the spool path
+        return None, "Not a supported image file"
+    except Exception as e:
+        return None, str(e)
+
+async def convert_image_file(file: UploadFile, options: WebPOptions) -> dict:
+    original_name = file.filename or "image"
+    path = spool_path()
+    try:
+        error = await spool_image(file, path)
+        if error is None:
+            webp, error = await convert_spooled_image(path, options)
+    finally:
+        path.unlink(missing_ok=True)
+    if error is not None:
+        return {"original_name": file.filename, "success": False, "error": error}
+    
+    return {
+        "original_name": original_name,
+        "new_name": os.path.splitext(original_name)[0] + ".webp",
+        "success": True,
+        "webp_base64": base64.b64encode(webp).decode(),
+        "size_bytes": len(webp)
+    }
+
+@api_router.post("/images/convert-to-webp")
+async def convert_images_to_webp(
+    files: List[UploadFile] = File(...),
+    preset: str = Form("balanced"),  # fast, balanced, smallest, lossless
+    quality: Optional[int] = Form(None),  # overrides the preset's quality
+    keep_alpha: bool = Form(False),  # keep transparency instead of flattening onto white
+    max_dimension: int = Form(0),  # longest side in pixels, 0 keeps the original size
+):
+    if len(files) > IMAGE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Maximum {IMAGE_MAX_FILES} images allowed per batch")
+    options = resolve_webp_options(preset, quality, keep_alpha, max_dimension)
     
+    # Each image is converted in image_pool; the batch takes about as long as its slowest image
+    tasks = [asyncio.ensure_future(convert_image_file(file, options)) for file in files]
+    try:
+        converted_images = await asyncio.gather(*tasks)
+    except PixelBudgetExceeded as e:
+        for task in tasks:
+            task.cancel()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(IMAGE_RETRY_AFTER)})
     return {"images": converted_images}
 
+async def stream_webp_zip(uploads: List[tuple], options: WebPOptions):
+    """Stream converted images as a stored ZIP, entries in completion order.
+
+    ``uploads`` holds (original_name, spooled path, spool error) per file;
+    the paths are removed once the stream ends. A manifest.json with
+    per-file results (in input order) is the last entry.
+    """
+    async def indexed(index: int, original_name: str, path: Path, error: Optional[str]):
+        if error is None:
+            try:
+                webp, error = await convert_spooled_image(path, options)
+            except PixelBudgetExceeded as e:
+                webp, error = None, str(e)
+            finally:
+                path.unlink(missing_ok=True)
+        return index, original_name, webp if error is None else None, error
+
+    archive = ZipStream()
+    manifest = []
+    names = set()
+    try:
+        conversions = (indexed(index, *upload) for index, upload in enumerate(uploads))
+        async for index, original_name, webp, error in as_completed_bounded(conversions):
+            entry = {"index": index, "original_name": original_name, "success": webp is not None}
+            if webp is None:
+                entry["error"] = error
+            else:
+                new_name = webp_filename(original_name)
+                if new_name in names:
+                    new_name = f"{new_name[:-5]}-{index + 1}.webp"
+                names.add(new_name)
+                entry.update(new_name=new_name, size_bytes=len(webp))
+                # WebP is already compressed, so entries are stored as they are
+                yield archive.add(new_name, webp)
+            manifest.append(entry)
+        manifest.sort(key=lambda entry: entry["index"])
+        yield archive.add("manifest.json", json.dumps(manifest, indent=2).encode(), zipfile.ZIP_DEFLATED)
+        yield archive.close()
+    finally:
+        for _, path, _ in uploads:
+            path.unlink(missing_ok=True)
+
+@api_router.post("/images/convert-to-webp/zip")
+async def convert_images_to_webp_zip(
+    files: List[UploadFile] = File(...),
+    preset: str = Form("balanced"),
+    quality: Optional[int] = Form(None),
+    keep_alpha: bool = Form(False),
+    max_dimension: int = Form(0),
+):
+    """Batch variant that streams a ZIP of WebP files instead of base64 JSON"""
+    if len(files) > IMAGE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Maximum {IMAGE_MAX_FILES} images allowed per batch")
+    options = resolve_webp_options(preset, quality, keep_alpha, max_dimension)
+    
+    # Uploads are closed once this handler returns, so spool them before streaming
+    paths = [spool_path() for _ in files]
+    try:
+        errors = await asyncio.gather(*(spool_image(file, path) for file, path in zip(files, paths)))
+    except BaseException:
+        for path in paths:
+            path.unlink(missing_ok=True)
+        raise
+    uploads = [(file.filename or "image", path, error) for file, path, error in zip(files, paths, errors)]
+    return StreamingResponse(
+        stream_webp_zip(uploads, options),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="webp-images.zip"'},
+    )
+
+@api_router.get("/images/budget")
+async def get_image_budget():
+    return pixel_budget.stats()
+
+@api_router.get("/images/cache/stats")
+async def get_image_cache_stats():
+    return webp_cache.stats()
+
+# Bulk jobs: up to IMAGE_JOB_MAX_FILES uploads, spooled to the job's inputs/ directory
+IMAGE_JOB_MAX_FILES = int(os.environ.get('IMAGE_JOB_MAX_FILES', '1000'))
+IMAGE_JOB_MAX_UPLOAD_BYTES = int(os.environ.get('IMAGE_JOB_MAX_UPLOAD_BYTES', str(1024 * 1024 * 1024)))
+IMAGE_JOB_MANIFEST_FIELDS = ["row", "original_name", "file", "size_bytes", "success", "error"]
+
+async def process_webp_job_chunk(job: dict, start_row: int, rows: List[dict]) -> tuple:
+    options = WebPOptions(**job["options"])
+    directory = job_dir(job["id"])
+
+    async def convert_row(row_number: int, row: dict):
+        if row["error"] is not None:
+            return row_number, row, None, row["error"]
+        while True:
+            try:
+                webp, error = await convert_spooled_image(directory / row["file"], options, use_cache=False)
+                return row_number, row, webp, error
+            except PixelBudgetExceeded:
+                # Jobs aren't in a hurry; wait for room instead of failing the image
+                continue
+
+    entries = []
+    manifest = []
+    converted = (convert_row(start_row + i + 1, row) for i, row in enumerate(rows))
+    async for row_number, row, webp, error in as_completed_bounded(converted, JOB_CONCURRENCY):
+        entry = {"row": row_number, "original_name": row["original_name"], "success": webp is not None, "error": error}
+        if webp is not None:
+            entry["file"] = f"{row_number:06d}-{webp_filename(row['original_name'])}"
+            entry["size_bytes"] = len(webp)
+            entries.append((entry["file"], webp))
+        manifest.append(entry)
+    manifest.sort(key=lambda entry: entry["row"])
+    return entries, manifest
+
+async def run_webp_job(job: dict):
+    await run_chunked_job(job, process_webp_job_chunk, IMAGE_JOB_MANIFEST_FIELDS)
+
+job_runner.register("webp", run_webp_job)
+
+@api_router.post("/images/jobs", response_model=JobStatus, status_code=202)
+async def create_webp_job(
+    files: List[UploadFile] = File(...),
+    preset: str = Form("balanced"),
+    quality: Optional[int] = Form(None),
+    keep_alpha: bool = Form(False),
+    max_dimension: int = Form(0),
+):
+    """Queue a bulk WebP conversion; poll /api/jobs/{id} for progress"""
+    if len(files) > IMAGE_JOB_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Maximum {IMAGE_JOB_MAX_FILES} images allowed per job")
+    options = resolve_webp_options(preset, quality, keep_alpha, max_dimension)
+
+    job_id = str(uuid.uuid4())
+    directory = job_dir(job_id)
+    (directory / "inputs").mkdir(parents=True)
+    try:
+        with open(directory / "input.jsonl", "w") as index:
+            for position, file in enumerate(files):
+                name = f"inputs/{position:06d}"
+                error = await spool_image(file, directory / name)
+                row = {"file": name, "original_name": file.filename or "image", "error": error}
+                index.write(json.dumps(row) + "\n")
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    job = await create_job(job_id, "webp", len(files), options._asdict())
+    return job_status(job)
+
 # ============== TEXT TO HTML ==============
 
+# Markdown is rendered in one pass over the lines of the document, with the
+# same rules as the old chain of re.sub passes over the whole text (headers,
+# ***, **, *, fenced code, `code`, then links, each applied to what the
+# previous one produced), so the HTML is the same. Inline patterns never
+# span lines, so each runs over one line at a time; the emphasis and code
+# patterns only ever fail near the end of a line and stay linear. Links are
+# found with str.find, because [(.+?)] backtracks quadratically over a line
+# full of unclosed '['.
+MD_FENCE = re.compile(r'```(.+?)```', re.DOTALL)
+MD_HEADERS = (("### ", "<h3>", "</h3>"), ("## ", "<h2>", "</h2>"), ("# ", "<h1>", "</h1>"))
+MD_EMPHASIS = (
+    ("***", re.compile(r'\*\*\*(.+?)\*\*\*'), r'<strong><em>\1</em></strong>'),
+    ("**", re.compile(r'\*\*(.+?)\*\*'), r'<strong>\1</strong>'),
+    ("*", re.compile(r'\*(.+?)\*'), r'<em>\1</em>'),
+)
+MD_CODE = re.compile(r'`(.+?)`')
+MD_BACKTICK = re.compile(r'`')
+
+def render_markdown_line(line: str, fences: List[tuple]) -> str:
+    """Inline markup of one line.
+
+    ``fences`` holds (n, tag) for ``` markers on this line that open or close
+    a fenced block, n being the index of the marker's first backtick among
+    the line's backticks (emphasis doesn't touch backticks, so it still finds
+    them).
+    """
+    prefix = suffix = ""
+    for marker, open_tag, close_tag in MD_HEADERS:
+        if line.startswith(marker) and len(line) > len(marker):
+            prefix, suffix = open_tag, close_tag
+            line = line[len(marker):]
+            break
+    
+    if "*" in line:
+        for marker, pattern, replacement in MD_EMPHASIS:
+            if marker in line:
+                line = pattern.sub(replacement, line)
+    
+    if fences:
+        ticks = [match.start() for match in MD_BACKTICK.finditer(line)]
+        parts = []
+        position = 0
+        for index, tag in fences:
+            offset = ticks[index]
+            parts.append(line[position:offset])
+            parts.append(tag)
+            position = offset + 3
+        parts.append(line[position:])
+        line = "".join(parts)
+    if "`" in line:
+        line = MD_CODE.sub(r'<code>\1</code>', line)
+    
+    if "[" in line:
+        parts = []
+        position = start_from = 0
+        while True:
+            opening = line.find("[", start_from)
+            if opening < 0:
+                break
+            # Without a "](" and ")" after this '[' there are none after later ones either
+            middle = line.find("](", opening + 2)
+            if middle < 0:
+                break
+            closing = line.find(")", middle + 3)
+            if closing < 0:
+                break
+            parts.append(line[position:opening])
+            parts.append(f'<a href="{line[middle + 2:closing]}">{line[opening + 1:middle]}</a>')
+            position = start_from = closing + 1
+        if parts:
+            parts.append(line[position:])
+            line = "".join(parts)
+    
+    return f"{prefix}{line}{suffix}" if prefix else line
+
+def markdown_to_html(text: str) -> str:
+    # ``` pairs may span lines, so they are found up front
+    fences = []  # (offset, tag)
+    for match in MD_FENCE.finditer(text):
+        fences.append((match.start(), "<pre><code>"))
+        fences.append((match.end() - 3, "</code></pre>"))
+    
+    html = []
+    chunk = []  # current paragraph, i.e. text between blank lines
+    pending_newline = False
+    first = True
+    
+    def emit(line: str):
+        # Same paragraph splitting as '\n'.join(lines).split('\n\n')
+        nonlocal pending_newline, first
+        if not first:
+            if pending_newline:
+                end_paragraph()
+                pending_newline = False
+            else:
+                pending_newline = True
+        first = False
+        if line:
+            if pending_newline:
+                chunk.append("\n")
+                pending_newline = False
+            chunk.append(line)
+    
+    def end_paragraph():
+        nonlocal chunk
+        paragraph = "".join(chunk)
+        chunk = []
+        if paragraph.strip():
+            html.append(paragraph if paragraph.startswith("<") else f"<p>{paragraph}</p>")
+    
+    in_list = False
+    offset = 0
+    fence_index = 0
+    for line in text.split("\n"):
+        line_fences = []
+        end = offset + len(line)
+        ticks_before = counted_to = 0
+        while fence_index < len(fences) and fences[fence_index][0] < end:
+            fence_offset, tag = fences[fence_index]
+            ticks_before += line.count("`", counted_to, fence_offset - offset)
+            counted_to = fence_offset - offset
+            line_fences.append((ticks_before, tag))
+            fence_index += 1
+        offset = end + 1
+        
+        line = render_markdown_line(line, line_fences)
+        stripped = line.strip()
+        if stripped.startswith("- "):
+            if not in_list:
+                emit("<ul>")
+                in_list = True
+            emit(f"<li>{stripped[2:]}</li>")
+        else:
+            if in_list:
+                emit("</ul>")
+                in_list = False
+            emit(line)
+    if in_list:
+        emit("</ul>")
+    if pending_newline:
+        chunk.append("\n")
+    end_paragraph()
+    return "".join(html)
+
 @api_router.post("/text-to-html", response_model=TextToHTMLResponse)
 async def convert_text_to_html(request: TextToHTMLRequest):
     text = request.text
     
     if request.format_type == "markdown":
-        # Simple markdown conversion
-        html = text
-        
-        # Headers
-        html = re.sub(r'^### (.+)$', r'<h3>\1</h3>', html, flags=re.MULTILINE)
-        html = re.sub(r'^## (.+)$', r'<h2>\1</h2>', html, flags=re.MULTILINE)
-        html = re.sub(r'^# (.+)$', r'<h1>\1</h1>', html, flags=re.MULTILINE)
-        
-        # Bold and italic
-        html = re.sub(r'\*\*\*(.+?)\*\*\*', r'<strong><em>\1</em></strong>', html)
-        html = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html)
-        html = re.sub(r'\*(.+?)\*', r'<em>\1</em>', html)
-        
-        # Code blocks
-        html = re.sub(r'```(.+?)```', r'<pre><code>\1</code></pre>', html, flags=re.DOTALL)
-        html = re.sub(r'`(.+?)`', r'<code>\1</code>', html)
-        
-        # Links
-        html = re.sub(r'\[(.+?)\]\((.+?)\)', r'<a href="\2">\1</a>', html)
-        
-        # Lists
-        lines = html.split('\n')
-        in_list = False
-        new_lines = []
-        for line in lines:
-            if line.strip().startswith('- '):
-                if not in_list:
-                    new_lines.append('<ul>')
-                    in_list = True
-                new_lines.append(f'<li>{line.strip()[2:]}</li>')
-            else:
-                if in_list:
-                    new_lines.append('</ul>')
-                    in_list = False
-                new_lines.append(line)
-        if in_list:
-            new_lines.append('</ul>')
-        html = '\n'.join(new_lines)
-        
-        # Paragraphs
-        paragraphs = html.split('\n\n')
-        html = ''.join([f'<p>{p}</p>' if not p.startswith('<') else p for p in paragraphs if p.strip()])
-        
+        html = markdown_to_html(text)
     else:
         # Basic conversion - escape HTML and preserve formatting
         html = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
@@ -569,15 +2626,91 @@ async def process_base64(request: Base64Request):
     except Exception as e:
         return Base64Response(result="", success=False, error=str(e))
 
+# ============== INDEXES ==============
+
+async def ensure_indexes():
+    """Create the indexes the queries above rely on (no-op when they exist)"""
+    await db.shortlinks.create_index("short_code", unique=True)
+    await db.shortlinks.create_index("id", unique=True)
+    await db.shortlinks.create_index([("created_at", DESCENDING), ("id", DESCENDING)])
+    await db.shortlinks.create_index([("clicks", DESCENDING)])
+    await db.shortlinks.create_index([("url_hash", ASCENDING), ("provider", ASCENDING)])
+    await db.shortlink_clicks.create_index([("short_code", ASCENDING), ("hour", ASCENDING)], unique=True)
+    await db.jobs.create_index("id", unique=True)
+    await db.jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+
+async def dedupe_short_codes(apply: bool) -> int:
+    """Find shortlinks sharing a short_code, which block the unique index.
+
+    With ``apply``, duplicates pointing at the same URL are merged into the
+    oldest document (clicks are summed) and the others get fresh local codes.
+    Returns the number of duplicate documents found.
+    """
+    groups = db.shortlinks.aggregate([
+        {"$group": {"_id": "$short_code", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    found = 0
+    async for group in groups:
+        docs = await db.shortlinks.find({"short_code": group["_id"]}).sort("created_at", ASCENDING).to_list(None)
+        keeper, duplicates = docs[0], docs[1:]
+        found += len(duplicates)
+        print(f"short_code {group['_id']!r}: {len(docs)} documents")
+        if not apply:
+            continue
+        for duplicate in duplicates:
+            if duplicate["original_url"] == keeper["original_url"]:
+                await db.shortlinks.update_one({"_id": keeper["_id"]}, {"$inc": {"clicks": duplicate.get("clicks", 0)}})
+                await db.shortlinks.delete_one({"_id": duplicate["_id"]})
+            else:
+                short_code = generate_local_code()
+                await db.shortlinks.update_one(
+                    {"_id": duplicate["_id"]},
+                    {"$set": {"short_code": short_code, "short_url": local_short_url(short_code), "provider": "local"}},
+                )
+    return found
+
+async def backfill_url_hashes(batch_size: int = 1000) -> int:
+    """Set url_hash on shortlinks created before deduplication existed"""
+    updated = 0
+    operations = []
+    async for shortlink in db.shortlinks.find({"url_hash": {"$exists": False}}, {"_id": 1, "original_url": 1}):
+        operations.append(UpdateOne({"_id": shortlink["_id"]}, {"$set": {"url_hash": url_hash(shortlink["original_url"])}}))
+        if len(operations) >= batch_size:
+            await db.shortlinks.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await db.shortlinks.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    return updated
+
+async def migrate(apply_dedupe: bool) -> int:
+    duplicates = await dedupe_short_codes(apply_dedupe)
+    if duplicates and not apply_dedupe:
+        print(f"{duplicates} duplicate short codes block the unique index; re-run with --dedupe to fix them")
+        return 1
+    await ensure_indexes()
+    print("Indexes are up to date")
+    print(f"Backfilled url_hash on {await backfill_url_hashes()} shortlinks")
+    return 0
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Room for the multipart framing around a full batch; first matching prefix wins
+app.add_middleware(UploadSizeLimit, limits={
+    "/api/images/jobs": IMAGE_JOB_MAX_UPLOAD_BYTES,
+    "/api/images/": IMAGE_MAX_FILES * IMAGE_MAX_BYTES + 1024 * 1024,
+})
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -587,6 +2720,54 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error("Index creation failed (run `python server.py migrate`): %s", e)
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+@app.on_event("startup")
+async def start_click_buffer():
+    click_buffer.start()
+
+@app.on_event("startup")
+async def warm_caches():
+    try:
+        await prewarm_shortlink_cache(SHORTLINK_CACHE_PREWARM)
+    except Exception as e:
+        logger.warning("Shortlink cache prewarm failed: %s", e)
+
+@app.on_event("shutdown")
+async def shutdown_job_runner():
+    await job_runner.stop()
+
+@app.on_event("shutdown")
+async def flush_click_buffer():
+    await click_buffer.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_worker_pools():
+    qr_render_pool.shutdown()
+    image_pool.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    await isgd_client.aclose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="E1 Utility Suite maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Create/backfill MongoDB indexes")
+    migrate_parser.add_argument("--dedupe", action="store_true", help="Fix duplicate short codes first")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        sys.exit(asyncio.run(migrate(args.dedupe)))
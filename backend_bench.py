@@ -0,0 +1,135 @@
+"""Micro-benchmark for the markdown branch of /api/text-to-html.
+
+Compares markdown_to_html with the previous chain of re.sub passes on
+documents of growing size, checks both produce the same HTML, and prints
+throughput. Run from the repository root:
+
+    python backend_bench.py [--sizes 1000,10000,100000,1000000] [--repeat 5]
+
+The legacy conversion is quadratic on the "unmatched" documents, so it is
+only timed on them up to --legacy-max characters.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+# server.py needs these at import time; no connection is made
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+from server import markdown_to_html  # noqa: E402
+
+
+def legacy_markdown_to_html(text):
+    """The markdown conversion as it was before markdown_to_html"""
+    html = text
+    html = re.sub(r'^### (.+)$', r'<h3>\1</h3>', html, flags=re.MULTILINE)
+    html = re.sub(r'^## (.+)$', r'<h2>\1</h2>', html, flags=re.MULTILINE)
+    html = re.sub(r'^# (.+)$', r'<h1>\1</h1>', html, flags=re.MULTILINE)
+    html = re.sub(r'\*\*\*(.+?)\*\*\*', r'<strong><em>\1</em></strong>', html)
+    html = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html)
+    html = re.sub(r'\*(.+?)\*', r'<em>\1</em>', html)
+    html = re.sub(r'```(.+?)```', r'<pre><code>\1</code></pre>', html, flags=re.DOTALL)
+    html = re.sub(r'`(.+?)`', r'<code>\1</code>', html)
+    html = re.sub(r'\[(.+?)\]\((.+?)\)', r'<a href="\2">\1</a>', html)
+    lines = html.split('\n')
+    in_list = False
+    new_lines = []
+    for line in lines:
+        if line.strip().startswith('- '):
+            if not in_list:
+                new_lines.append('<ul>')
+                in_list = True
+            new_lines.append(f'<li>{line.strip()[2:]}</li>')
+        else:
+            if in_list:
+                new_lines.append('</ul>')
+                in_list = False
+            new_lines.append(line)
+    if in_list:
+        new_lines.append('</ul>')
+    html = '\n'.join(new_lines)
+    paragraphs = html.split('\n\n')
+    return ''.join([f'<p>{p}</p>' if not p.startswith('<') else p for p in paragraphs if p.strip()])
+
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "**bold**", "*italic*", "***both***",
+         "`code`", "[link](https://example.com)", "consectetur", "adipiscing", "elit"]
+
+
+def typical_document(size, seed=0):
+    """Headers, paragraphs, lists and code blocks until ``size`` characters"""
+    rng = random.Random(seed)
+    blocks = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            block = f"{'#' * rng.randint(1, 3)} {' '.join(rng.choices(WORDS, k=4))}"
+        elif kind < 0.3:
+            block = "\n".join(f"- {' '.join(rng.choices(WORDS, k=6))}" for _ in range(rng.randint(2, 6)))
+        elif kind < 0.4:
+            block = "```\n" + "\n".join(" ".join(rng.choices(WORDS[:5], k=8)) for _ in range(4)) + "\n```"
+        else:
+            block = " ".join(rng.choices(WORDS, k=rng.randint(20, 80)))
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks)
+
+
+def unmatched_markers(size):
+    """One long line of unclosed markers, the worst case for (.+?) patterns"""
+    return ("*** ** [a] `" * (size // 12 + 1))[:size]
+
+
+def best_time(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--legacy-max", type=int, default=20000)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    mismatches = 0
+    for name, make, legacy_max in (
+        ("typical", typical_document, None),
+        ("unmatched", unmatched_markers, args.legacy_max),
+    ):
+        print(f"\n{name} documents")
+        print(f"{'chars':>10} {'legacy ms':>10} {'new ms':>10} {'legacy MB/s':>12} {'new MB/s':>10} {'speedup':>8}")
+        for size in sizes:
+            text = make(size)
+            new = best_time(markdown_to_html, text, args.repeat)
+            megabytes = len(text) / 1e6
+            if legacy_max is not None and size > legacy_max:
+                print(f"{len(text):>10} {'-':>10} {new * 1000:>10.2f} {'-':>12} {megabytes / new:>10.1f} {'-':>8}")
+                continue
+            if legacy_markdown_to_html(text) != markdown_to_html(text):
+                mismatches += 1
+                print(f"!! output differs for {name} document of {size} chars")
+            legacy = best_time(legacy_markdown_to_html, text, args.repeat)
+            print(f"{len(text):>10} {legacy * 1000:>10.2f} {new * 1000:>10.2f} "
+                  f"{megabytes / legacy:>12.1f} {megabytes / new:>10.1f} {legacy / new:>7.1f}x")
+
+    if mismatches:
+        print(f"\n❌ {mismatches} outputs differ from the legacy conversion")
+        return 1
+    print("\n✅ Outputs identical to the legacy conversion")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -152,7 +152,31 @@ class E1UtilitySuiteTester:
             }
         )
         
-        return success1 and success2 and success3
+        # Test SVG output
+        success4, response4 = self.run_test(
+            "Generate SVG QR Code",
+            "POST",
+            "qr/generate",
+            200,
+            data={
+                "items": [{"content": "Hello SVG", "content_type": "text"}],
+                "format": "svg",
+                "error_correction": "Q",
+                "use_isgd": False
+            }
+        )
+        
+        if success4 and response4:
+            result = response4['results'][0]
+            if result.get('mime_type') != "image/svg+xml":
+                print(f"❌ Expected image/svg+xml, got {result.get('mime_type')}")
+                return False
+            if not base64.b64decode(result['image_base64']).startswith(b"<svg"):
+                print("❌ SVG output is not an SVG document")
+                return False
+            print("✅ SVG QR generated")
+        
+        return success1 and success2 and success3 and success4
 
     def test_shortlinks(self):
         """Test shortlink batch functionality with is.gd integration"""